@@ -27,6 +27,9 @@ setuptools.setup(
             'mypy>=0.910,<1.0',
             'pytest~=7.1.3',
         ],
+        'xxhash': [
+            'xxhash>=2.0,<5.0',
+        ],
     },
     classifiers=[
         'Development Status :: 3 - Alpha',
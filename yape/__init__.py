@@ -3,12 +3,13 @@
 # file, You can obtain one at https://mozilla.org/MPL/2.0/.
 from __future__ import annotations
 
+import importlib
 import inspect
 import pathlib
 import subprocess
+import weakref
 
 from . import (
-    climodule,
     gn,
     grun,
     mingraphmod,
@@ -17,6 +18,7 @@ from . import (
     pathprovider,
     resmod,
     ty,
+    util,
     yapecontext,
 )
 
@@ -56,15 +58,24 @@ YapeContext = yapecontext.YapeContext
 mingraph = mingraphmod.mingraph
 
 
+CircularDependencyError = util.CircularDependencyError
+
+
 def graph(**kw: ty.Any) -> gn.Graph:
     return gn.Graph(**kw)
 
 
-def load(path: ty.Union[pathlib.Path, str]) -> gn.Graph:
+def load(path: ty.Union[pathlib.Path, str],
+         buffers: ty.Optional[ty.Iterable[ty.Any]] = None,
+         ) -> gn.Graph:
     """
-    Shorthand for ``yape.gn.Graph.load(path)``.
+    Shorthand for ``yape.gn.Graph.load(path, buffers)``.
     """
-    return gn.Graph.load(path)
+    return gn.Graph.load(path, buffers)
+
+
+# Types accepted as paths by input() and output()
+_PATH_TYPES = (pathlib.PurePath, str)
 
 
 @ty.overload
@@ -78,7 +89,7 @@ def input(v: gn.Node[T]) -> nodeop.ResourceIn[gn.Node[T]]:
 def input(v: ty.Union[pathlib.PurePath, str, gn.Node[T]],
           *rest: ty.Union[pathlib.PurePath, str],
           )-> ty.Union[nodeop.PathIn, nodeop.ResourceIn[gn.Node[T]]]:
-    if isinstance(v, (pathlib.PurePath, str)):
+    if isinstance(v, _PATH_TYPES):
         return nodeop.PathIn(v, *rest)
     elif isinstance(v, gn.Node):
         if rest:
@@ -101,7 +112,7 @@ def output(v: gn.Node[T]) -> nodeop.ResourceOut[gn.Node[T]]:
 def output(v: ty.Union[pathlib.PurePath, str, gn.Node[T]],
           *rest: ty.Union[pathlib.PurePath, str],
            ) -> ty.Union[nodeop.PathOut, nodeop.ResourceOut[gn.Node[T]]]:
-    if isinstance(v, (pathlib.PurePath, str)):
+    if isinstance(v, _PATH_TYPES):
         return nodeop.PathOut(v, *rest)
     elif isinstance(v, gn.Node):
         if rest:
@@ -145,13 +156,13 @@ def gr(nodegen: ty.Callable[..., ty.Any],
        kwargs: ty.Optional[ty.Mapping[str, ty.Any]] = None,
        **kw: ty.Any,
        ) -> ty.Union[ty.Callable[..., gn.Graph], gn.Graph]:
-    def graph_creator(*nodegen_args: ty.Any, **nodegen_kwargs: ty.Any) -> gn.Graph:
-        g = gn.Graph(**kw)
-        with g:
-            nodegen(*nodegen_args, **nodegen_kwargs)
-        return g
-
     if args is None and kwargs is None:
+        def graph_creator(*nodegen_args: ty.Any, **nodegen_kwargs: ty.Any) -> gn.Graph:
+            g = gn.Graph(**kw)
+            with g:
+                nodegen(*nodegen_args, **nodegen_kwargs)
+            return g
+
         return graph_creator
 
     if args is None:
@@ -160,7 +171,10 @@ def gr(nodegen: ty.Callable[..., ty.Any],
     if kwargs is None:
         kwargs = {}
 
-    return graph_creator(*args, **kwargs)
+    g = gn.Graph(**kw)
+    with g:
+        nodegen(*args, **kwargs)
+    return g
 
 
 @ty.overload
@@ -192,20 +206,21 @@ def fn(f: ty.Callable[..., T],
        kwargs: ty.Optional[ty.Mapping[str, ty.Any]] = None,
        **kw: ty.Any,
        ) -> ty.Union[ty.Callable[..., gn.Node[T]], gn.Node[T]]:
-    def node_creator(*call_args: ty.Any, **call_kwargs: ty.Any) -> gn.Node[T]:
-        op = nodeop.Call(f, call_args, call_kwargs)
-        return gn.Node(op, **kw)
-
     if args is None and kwargs is None:
-        return node_creator
+        def node_creator(*call_args: ty.Any, **call_kwargs: ty.Any) -> gn.Node[T]:
+            op = nodeop.Call(f, call_args, call_kwargs)
+            return gn.Node(op, **kw)
 
-    if args is None:
-        args = tuple()
-
-    if kwargs is None:
-        kwargs = {}
+        return node_creator
 
-    return node_creator(*args, **kwargs)
+    # Make copies of the arguments, just like they would be made when calling
+    # a function with *args and **kwargs.
+    op = nodeop.Call(
+        f,
+        tuple(args) if args is not None else (),
+        dict(kwargs) if kwargs is not None else {},
+    )
+    return gn.Node(op, **kw)
 
 
 @ty.overload
@@ -250,7 +265,7 @@ def _cmd_fn(args: ty.Union[str, ty.List[ty.Any], ty.Tuple[ty.Any, ...]],
             **subprocess_run_kw: ty.Any,
             ) -> subprocess.CompletedProcess[ty.Any]:
     if not isinstance(args, str):
-        args = tuple(str(arg) for arg in args)
+        args = [str(arg) for arg in args]
     return subprocess.run(args, **subprocess_run_kw)
 
 
@@ -275,6 +290,17 @@ def cmd(args: ty.Union[str, ty.List[ty.Any], ty.Tuple[ty.Any, ...]],
     return fn(_cmd_fn, args=[args], kwargs=subprocess_run_kw, **node_kw)
 
 
+_node_default_args: weakref.WeakKeyDictionary[
+    ty.Callable[..., ty.Any],
+    ty.Tuple[ty.Tuple[ty.Any, ...], ty.Dict[str, ty.Any]],
+] = weakref.WeakKeyDictionary()
+"""
+Cache of arguments built by ``node()`` from the default values of the
+decorated functions, so that the signature of a function is inspected only
+once.
+"""
+
+
 @ty.overload
 def node(f: ty.Callable[..., T],
          /,
@@ -294,10 +320,19 @@ def node(f: ty.Optional[ty.Callable[..., T]] = None,
                        ty.Callable[[ty.Callable[..., T]], gn.Node[T]],
                        ]:
     def decorator(f: ty.Callable[..., T]) -> gn.Node[T]:
-        sig = inspect.signature(f)
-        bound = sig.bind()
-        bound.apply_defaults()
-        return fn(f, bound.args, bound.kwargs, **kw)
+        try:
+            args, kwargs = _node_default_args[f]
+        except (KeyError, TypeError):
+            sig = inspect.signature(f)
+            bound = sig.bind()
+            bound.apply_defaults()
+            args, kwargs = bound.args, bound.kwargs
+            try:
+                _node_default_args[f] = (args, kwargs)
+            except TypeError:
+                # f can not be weakly referenced
+                pass
+        return fn(f, args, kwargs, **kw)
 
     if f is None:
         return decorator
@@ -309,4 +344,18 @@ def run(*k: ty.Any, **kw: ty.Any) -> grun.RunResult:
     return runner.run(*k, **kw)
 
 
-cli = climodule.CLI()
+# The CLI is only needed when running yape from the command line, so it is
+# loaded lazily to avoid importing argparse and building the parser
+# otherwise.
+if ty.TYPE_CHECKING:
+    from . import climodule
+    cli: climodule.CLI
+else:
+    def __getattr__(name):
+        if name == 'climodule':
+            return importlib.import_module('.climodule', __name__)
+        if name == 'cli':
+            global cli
+            cli = __getattr__('climodule').CLI()
+            return cli
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
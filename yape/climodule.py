@@ -7,6 +7,7 @@ import argparse
 import importlib.abc
 import importlib.machinery
 import importlib.util
+import operator
 import pathlib
 import sys
 
@@ -23,12 +24,17 @@ from . import (
 class CLI:
     SD = argparse_subdec.SubDec(name_prefix='__cmd_', fn_dest='core_fn')
 
+    __parser: ty.Optional[argparse.ArgumentParser] = None
+    """
+    The argument parser. It does not depend on the state of instances, so it
+    is shared by all of them and only created when first needed.
+    """
+
     def __init__(self, graph: ty.Optional[gn.Graph] = None):
         if graph is None:
             graph = gn._global_graph
         self.__graph = graph
         self.__runner = grun.Runner()
-        self.__init_parser()
 
     def run(self, argv: ty.Optional[ty.Sequence[str]] = None) -> int:
         self.__args = self.__parse_args(argv)
@@ -37,6 +43,8 @@ class CLI:
         if not self.__args.core_subcommand:
             self.__args.core_subcommand = 'run'
             self.__args.core_fn = CLI.__cmd_run
+            self.__args.run_targets = None
+            self.__args.run_force = False
 
         self.__args.core_fn(self)
         return 0
@@ -47,10 +55,14 @@ class CLI:
     def set_runner(self, runner: grun.Runner) -> None:
         self.__runner = runner
 
-    def __init_parser(self) -> None:
-        self.__parser = argparse.ArgumentParser(description='Run Yape!')
+    @staticmethod
+    def __get_parser() -> argparse.ArgumentParser:
+        if CLI.__parser is not None:
+            return CLI.__parser
+
+        parser = argparse.ArgumentParser(description='Run Yape!')
 
-        self.__parser.add_argument(
+        parser.add_argument(
             '--yp',
             default='yp',
             dest='core_yp',
@@ -58,27 +70,36 @@ class CLI:
             help="""Path to entrypoint module or file."""
         )
 
-        self.__subparsers = self.__parser.add_subparsers(
+        subparsers = parser.add_subparsers(
             title='subcommands',
             dest='core_subcommand',
         )
 
-        CLI.SD.create_parsers(self.__subparsers)
+        CLI.SD.create_parsers(subparsers)
+
+        CLI.__parser = parser
+        return parser
 
     def __parse_args(self,
                      argv: ty.Optional[ty.Sequence[str]],
                      ) -> argparse.Namespace:
-        if argv is None:
-            argv = sys.argv[1:]
-        argv = list(argv)
-        return self.__parser.parse_args(argv)
+        # NOTE: argparse already defaults to sys.argv[1:] when argv is None
+        # and makes its own copy of argv otherwise.
+        return CLI.__get_parser().parse_args(argv)
 
     def __load_yp(self) -> None:
         name = self.__args.core_yp
-        sys.path = ['.'] + sys.path
+        path_inserted = not sys.path or sys.path[0] != '.'
+        if path_inserted:
+            sys.path.insert(0, '.')
         try:
-            spec: ty.Optional[importlib.machinery.ModuleSpec]
-            spec = importlib.util.find_spec(name)
+            spec: ty.Optional[importlib.machinery.ModuleSpec] = None
+            if not pathlib.Path(name).is_file():
+                try:
+                    spec = importlib.util.find_spec(name)
+                except ModuleNotFoundError:
+                    # This happens when a parent package does not exist
+                    pass
             if not spec:
                 spec = importlib.util.spec_from_file_location('yp', name)
 
@@ -91,8 +112,8 @@ class CLI:
             if hasattr(module, 'nodegen'):
                 module.nodegen()
         finally:
-            if sys.path and sys.path[0] == '.':
-                sys.path = sys.path[1:]
+            if path_inserted and sys.path and sys.path[0] == '.':
+                del sys.path[0]
 
     # SUBCOMMANDS
     # ===========
@@ -119,14 +140,14 @@ class CLI:
         """
     )
     def __cmd_run(self) -> None:
-        targets = getattr(self.__args, 'run_targets', None)
+        targets = self.__args.run_targets
         if not targets:
             targets = None
 
         self.__runner.run(
             graph=self.__graph,
             targets=targets,
-            force=getattr(self.__args, 'run_force', False),
+            force=self.__args.run_force,
             return_results=False,
         )
 
@@ -147,10 +168,12 @@ class CLI:
     def __cmd_list(self) -> None:
         pred: ty.Optional[ty.Callable[[gn.Node[ty.Any]], bool]] = None
         if not self.__args.list_all:
-            def pred(node: gn.Node[ty.Any]) -> bool:
-                return node._has_explicit_name
-        for node in self.__graph.recurse_nodes(pred):
-            print(node._fullname())
+            pred = operator.attrgetter('_has_explicit_name')
+        # Write everything at once instead of calling print() for each node.
+        sys.stdout.write(''.join(
+            f'{node._fullname()}\n'
+            for node in self.__graph.recurse_nodes(pred)
+        ))
 
     @SD.cmd(
         description="""
@@ -166,11 +189,13 @@ class CLI:
         metavar='TARGET',
     )
     def __cmd_deps(self) -> None:
-        targets = getattr(self.__args, 'deps_targets', None)
+        targets = self.__args.deps_targets
         if not targets:
             targets = None
         nodes, _ = util.parse_targets(targets, self.__graph)
+        lines = []
         for node in nodes:
-            print(node._fullname())
+            lines.append(f'{node._fullname()}\n')
             for dep in node._get_dep_nodes():
-                print(f'    {dep._fullname()}')
+                lines.append(f'    {dep._fullname()}\n')
+        sys.stdout.write(''.join(lines))
@@ -32,6 +32,21 @@ T = ty.TypeVar('T')
 
 
 class Node(ty.Generic[T]):
+    __deps: ty.Optional[ty.Tuple[nodeop.NodeOp,
+                                 ty.List[ty.Tuple[Node[ty.Any], bool]]]] = None
+    """
+    The operation of this node and the nodes it references, as computed by
+    ``__get_deps()``. This is defined at the class level so that graphs
+    pickled before it was introduced can still be loaded.
+    """
+
+    __fullname: ty.Optional[str] = None
+    """
+    Cached value for ``_fullname()``. Names of nodes and graphs are fixed once
+    they are added to their parents (they are the keys used to find them), so
+    this does not need to be invalidated.
+    """
+
     def __init__(self,
             op: nodeop.NodeOp,
             name: ty.Optional[str] = None,
@@ -59,6 +74,7 @@ class Node(ty.Generic[T]):
 
         pins = set(nodeop.PathIn(p) for p in pathins)
         pouts = set(nodeop.PathOut(p) for p in pathouts)
+        deps = []
 
         for evt in self.__op_walk():
             if isinstance(evt, walkproto.PathOut):
@@ -67,7 +83,17 @@ class Node(ty.Generic[T]):
                 pins.add(evt.value)
             elif isinstance(evt, walkproto.ResourceOut):
                 assert evt.value is not None
-                evt.value.node._resource_producers.add(self)
+                producers = evt.value.node._resource_producers
+                if isinstance(producers, set):
+                    # Graphs pickled by older versions store producers in a
+                    # set.
+                    producers = dict.fromkeys(producers)
+                    evt.value.node._resource_producers = producers
+                producers[self] = None
+                deps.append((evt.value.node, False))
+            elif isinstance(evt, walkproto.ResourceIn):
+                assert evt.value is not None
+                deps.append((evt.value.node, True))
             elif isinstance(evt, walkproto.Node):
                 assert evt.value is not None
                 if isinstance(evt.value._op, nodeop.Resource):
@@ -75,6 +101,10 @@ class Node(ty.Generic[T]):
                         'resource nodes can not be used directly. '
                         'Wrap them with either yape.input() or yape.output().'
                     )
+                deps.append((evt.value, False))
+        # The walk above is the same one done by __get_deps(), so use it to
+        # seed the cache.
+        self.__deps = (op, deps)
         self._pathins: ty.Tuple[nodeop.PathIn, ...] = tuple(sorted(pins))
         self._pathouts: ty.Tuple[nodeop.PathOut, ...] = tuple(sorted(pouts))
 
@@ -91,15 +121,18 @@ class Node(ty.Generic[T]):
             if self._pathins:
                 raise ValueError('pathins are only allowed inside a graph')
 
-        self._resource_producers: ty.Set[Node[ty.Any]] = set()
+        self._resource_producers: ty.Dict[Node[ty.Any], None] = {}
         """
         This attribute is specific for nodes with Resource operators. It is
         updated by other nodes that declare to produce this resource, i.e.,
         those that have ``nodeop.ResourceOut(self)`` as part of their
-        arguments.
+        arguments. A dictionary is used as an insertion-ordered set.
         """
 
     def _fullname(self) -> ty.Optional[str]:
+        if self.__fullname is not None:
+            return self.__fullname
+
         if not self._name:
             return None
 
@@ -107,12 +140,13 @@ class Node(ty.Generic[T]):
         g = self.__parent
         if g:
             root: Graph = g._Graph__root # type: ignore[attr-defined]
-        while g and g != root:
+        while g is not None and g is not root:
             if g.name is None:
                 raise ValueError('one of the parent graphs has no name')
             stack.append(g.name)
             g = g._Graph__parent # type: ignore[attr-defined]
-        return '/'.join(reversed(stack))
+        self.__fullname = '/'.join(reversed(stack))
+        return self.__fullname
 
     def _set(self, value: ty.Any) -> None:
         if not isinstance(self._op, nodeop.Value):
@@ -142,22 +176,41 @@ class Node(ty.Generic[T]):
             op = self._op
         yield from walkproto.walk(op)
 
-    def _get_dep_nodes(self) -> ty.Generator[Node[ty.Any], None, None]:
-        for evt in self.__op_walk():
+    def __get_deps(self) -> ty.List[ty.Tuple[Node[ty.Any], bool]]:
+        """
+        Return the nodes referenced by this node's operation, in the order
+        they appear, each paired with a boolean telling whether it is a
+        resource used as input. The result is cached for as long as
+        ``self._op`` is the same object.
+        """
+        op = self._op
+        if self.__deps is not None and self.__deps[0] is op:
+            return self.__deps[1]
+        deps = []
+        for evt in self.__op_walk(op):
             if isinstance(evt, walkproto.Node):
                 assert evt.value is not None
-                yield evt.value
+                deps.append((evt.value, False))
             elif isinstance(evt, walkproto.ResourceIn):
                 assert evt.value is not None
-                yield evt.value.node
-                yield from evt.value.node._resource_producers
+                deps.append((evt.value.node, True))
             elif isinstance(evt, walkproto.ResourceOut):
                 assert evt.value is not None
-                yield evt.value.node
+                deps.append((evt.value.node, False))
+        self.__deps = (op, deps)
+        return deps
 
-        for p in self._pathins:
-            if self.__parent is not None:
-                dep = self.__parent.path_producer(pathlib.Path(p))
+    def _get_dep_nodes(self) -> ty.Generator[Node[ty.Any], None, None]:
+        for dep_node, is_resource_in in self.__get_deps():
+            yield dep_node
+            if is_resource_in:
+                # Resource producers are not cached, since they might change
+                # as new nodes are created.
+                yield from dep_node._resource_producers
+
+        if self.__parent is not None:
+            for p in self._pathins:
+                dep = self.__parent.path_producer(p)
                 if dep:
                     yield dep
 
@@ -191,6 +244,21 @@ class Node(ty.Generic[T]):
 
 
 class Graph:
+    __fullname: ty.Optional[str] = None
+    """
+    Cached value for ``fullname()``. Like for nodes, the names in the
+    hierarchy are fixed once graphs are added to their parents. This is
+    defined at the class level so that graphs pickled before it was
+    introduced can still be loaded.
+    """
+
+    __prefix_counters: ty.Optional[ty.Dict[str, int]] = None
+    """
+    A dictionary mapping name prefixes of automatically named nodes to the
+    last index used for them. This is defined at the class level so that
+    graphs pickled before it was introduced can still be loaded.
+    """
+
     def __init__(self,
                 name: ty.Optional[str] = None,
                 parent: ty.Optional[Graph] = None,
@@ -244,50 +312,81 @@ class Graph:
         return None
 
     def fullname(self) -> str:
+        if self.__fullname is not None:
+            return self.__fullname
+
         stack = []
         g = self
-        while g != self.__root:
+        root = self.__root
+        while g is not root:
             if g.name is None:
                 msg = 'one of the graphs in the hierarchy has no name'
                 raise ValueError(msg)
             stack.append(g.name)
             assert g.__parent is not None
             g = g.__parent
-        return '/'.join(reversed(stack))
+        self.__fullname = '/'.join(reversed(stack))
+        return self.__fullname
+
+    def save(self,
+             path: ty.Union[pathlib.Path, str],
+             buffer_callback: ty.Optional[
+                 ty.Callable[[pickle.PickleBuffer], ty.Any]
+             ] = None,
+             ) -> None:
+        """
+        Save this graph to the file at `path`.
 
-    def save(self, path: ty.Union[pathlib.Path, str]) -> None:
+        If `buffer_callback` is given, it is passed to the pickler so that
+        objects supporting out-of-band data (e.g. ``pickle.PickleBuffer``
+        instances) have their buffers passed to it instead of being written to
+        the file. Those buffers must then be passed to `load()`.
+        """
         if self.__in_build_context:
             msg = 'can not save a graph that is currently in build context'
             raise RuntimeError(msg)
 
         with open(path, 'wb') as f:
-            CustomPickler(f).dump(self)
+            pickler = CustomPickler(
+                f,
+                protocol=pickle.HIGHEST_PROTOCOL,
+                buffer_callback=buffer_callback,
+            )
+            pickler.dump(self)
 
     @staticmethod
-    def load(path: ty.Union[pathlib.Path, str]) -> Graph:
+    def load(path: ty.Union[pathlib.Path, str],
+             buffers: ty.Optional[ty.Iterable[ty.Any]] = None,
+             ) -> Graph:
+        """
+        Load a graph saved with `save()`. If a ``buffer_callback`` was used
+        when saving, the collected buffers must be passed as `buffers`.
+        """
         with open(path, 'rb') as f:
-            return ty.cast(Graph, pickle.load(f))
+            return ty.cast(Graph, pickle.load(f, buffers=buffers))
 
     def node(self, path: NodeName) -> ty.Union[Node[ty.Any], Graph]:
+        graph_names: ty.Tuple[str, ...]
         if isinstance(path, str):
-            parts = tuple(path.split('/'))
+            # Most lookups are for nodes directly in the graph, so avoid
+            # splitting the path when there is no slash.
+            head, sep, node_name = path.rpartition('/')
+            graph_names = tuple(head.split('/')) if sep else ()
         else:
             parts = tuple(path)
-
-        if not parts:
-            raise KeyError('received empty path as key')
-
-        graph_names = parts[:-1]
-        node_name = parts[-1]
+            if not parts:
+                raise KeyError('received empty path as key')
+            graph_names = parts[:-1]
+            node_name = parts[-1]
 
         cur_graph = self
         for i, graph_name in enumerate(graph_names):
             if graph_name not in cur_graph.__name2node:
-                partial_path = parts[:i]
+                partial_path = graph_names[:i]
                 raise KeyError(f'graph at {partial_path!r} does not contain a child named {graph_name!r}')
             next_graph = cur_graph.__name2node[graph_name]
             if not isinstance(next_graph, Graph):
-                partial_path = parts[:i+1]
+                partial_path = graph_names[:i+1]
                 raise KeyError(f'element at {partial_path!r} is not a graph')
             cur_graph = next_graph
 
@@ -299,21 +398,32 @@ class Graph:
     def recurse_nodes(self,
                       pred: ty.Optional[ty.Callable[[Node[ty.Any]], bool]] = None,
                       ) -> ty.Generator[Node[ty.Any], None, None]:
-        if pred:
-            yield from (n for n in self.__nodes if pred(n))
-        else:
-            yield from self.__nodes
-        for g in self.__graphs:
-            yield from g.recurse_nodes(pred)
-
-    def path_producer(self, path: pathlib.Path) -> ty.Optional[Node[ty.Any]]:
+        # Use an explicit stack instead of recursing into subgraphs so that
+        # deep hierarchies do not create a chain of nested generators.
+        stack = [self]
+        while stack:
+            g = stack.pop()
+            if pred:
+                yield from (n for n in g.__nodes if pred(n))
+            else:
+                yield from g.__nodes
+            stack.extend(reversed(g.__graphs))
+
+    def path_producer(self, path: pathlib.PurePath) -> ty.Optional[Node[ty.Any]]:
         """
         Return the node that declares to produce the path `path` or None if there
         is no such node.
         """
-        p = nodeop.PathOut(path)
-        if p in self.__root.__pathout2node:
-            return self.__root.__pathout2node[p]
+        # Instances of nodeop.PathIn and nodeop.PathOut compare and hash
+        # equal to each other when they refer to the same path, so there is no
+        # need to wrap them again.
+        if isinstance(path, (nodeop.PathIn, nodeop.PathOut)):
+            p = ty.cast(nodeop.PathOut, path)
+        else:
+            p = nodeop.PathOut(path)
+        node = self.__root.__pathout2node.get(p)
+        if node is not None:
+            return node
         return _global_graph.__pathout2node.get(p)
 
     def mingraph(self,
@@ -336,17 +446,21 @@ class Graph:
     def __add_node(self, node: Node[ty.Any]) -> None:
         if not node._name:
             prefix = node._name_prefix
+            if not prefix and isinstance(node._op, nodeop.Call):
+                prefix = getattr(node._op.fn, '__name__', None)
             if not prefix:
-                if (isinstance(node._op, nodeop.Call)
-                        and hasattr(node._op.fn, '__name__')):
-                    prefix = node._op.fn.__name__
-                else:
-                    prefix= 'unnamed'
-            idx = 0
+                prefix = 'unnamed'
             node._name = prefix
-            while node._name in self.__name2node:
-                idx += 1
-                node._name = f'{prefix}-{idx}'
+            if node._name in self.__name2node:
+                if self.__prefix_counters is None:
+                    self.__prefix_counters = {}
+                # Names are never removed from the graph, so we can resume
+                # from the last index used for this prefix.
+                idx = self.__prefix_counters.get(prefix, 0)
+                while node._name in self.__name2node:
+                    idx += 1
+                    node._name = f'{prefix}-{idx}'
+                self.__prefix_counters[prefix] = idx
 
         if node._name in self.__name2node:
             msg = f'there is already a node named "{node._name}"'
@@ -354,7 +468,7 @@ class Graph:
         self.__name2node[node._name] = node
 
         for p in node._pathouts:
-            if self.path_producer(pathlib.Path(p)):
+            if self.path_producer(p):
                 msg = f'found multiple nodes declaring to produce {p}'
                 raise ValueError(msg)
             self.__root.__pathout2node[p] = node
@@ -363,10 +477,23 @@ class Graph:
 
 
 class CustomPickler(pickle.Pickler):
+    def __init__(self, *k: ty.Any, **kw: ty.Any):
+        super().__init__(*k, **kw)
+        self.__warned_types: ty.Set[type] = set()
+        """
+        Classes defined in the __main__ module whose instances have already
+        been warned about. This avoids logging one warning per instance.
+        """
+
     # NOTE: We should use types.NotImplementedType, but that is only supported
     # starting at Python 3.10
     def reducer_override(self, obj: ty.Any) -> ty.Any:
         if getattr(obj, '__module__', '') == '__main__':
+            obj_type = type(obj)
+            if obj_type.__module__ == '__main__':
+                if obj_type in self.__warned_types:
+                    return NotImplemented
+                self.__warned_types.add(obj_type)
             msg = (
                 f'the object {obj} is defined in the __main__ module, '
                 'you may run into issues if loading this graph from another module'
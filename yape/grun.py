@@ -5,7 +5,6 @@
 """
 from __future__ import annotations
 
-import contextlib
 import pathlib
 
 from . import (
@@ -39,51 +38,77 @@ class Runner:
             ) -> RunResult:
         target_nodes, targets = util.parse_targets(targets, graph)
 
-        # Get nodes to be executed
-        nodes_to_run, dependant_counts = util.topological_sort(target_nodes)
-
-        ctx: ty.Union[yapecontext.YapeContext, ty.ContextManager[None]]
-        if context is None:
-            if yapecontext._current_context is None:
-                ctx = yapecontext.YapeContext()
-            else:
-                # Let's make this a null context since a context is already in
-                # place.
-                ctx = contextlib.nullcontext()
+        # Get nodes to be executed. The targets are passed in the order they
+        # were given instead of target_nodes (a set) so that the execution
+        # order is deterministic: chains of nodes are run depth-first, with
+        # independent ones taken in the order they are given or referenced.
+        ordered_targets: ty.Iterable[gn.Node[ty.Any]]
+        if isinstance(targets, dict):
+            ordered_targets = targets.values()
+        elif isinstance(targets, tuple):
+            ordered_targets = targets
         else:
-            ctx = context
+            ordered_targets = (targets,)
+        nodes_to_run, dependant_counts = util.topological_sort(ordered_targets)
+
+        if context is None and yapecontext._current_context is not None:
+            # A context is already in place, so use it. Nodes might have
+            # changed since the context was last used (e.g. a value set with
+            # Node._set()), so drop states and data memoized in previous runs.
+            nodestate.reset_states()
+            return self.__run(nodes_to_run, dependant_counts, target_nodes,
+                              targets, force, return_results)
 
+        if context is None:
+            context = yapecontext.YapeContext()
+
+        with context:
+            return self.__run(nodes_to_run, dependant_counts, target_nodes,
+                              targets, force, return_results)
+
+    def __run(self,
+              nodes_to_run: ty.List[gn.Node[ty.Any]],
+              dependant_counts: ty.Dict[gn.Node[ty.Any], int],
+              target_nodes: ty.Set[gn.Node[ty.Any]],
+              targets: util.ParsedTargetsSpec,
+              force: bool,
+              return_results: bool,
+              ) -> RunResult:
         return_value: RunResult
+        # Parent directories of path outputs already created during this run
+        made_dirs: ty.Set[pathlib.PurePath] = set()
         # Run nodes
-        with ctx:
-            for node in nodes_to_run:
-                if not node._must_run():
-                    if not (force and node in target_nodes):
-                        continue
-                node_ctx = NodeContext(node)
-                resolved_op = walkproto.resolve_op(node._op, node_ctx)
-                for pout in node._pathouts:
-                    p = pathlib.Path(pout)
-                    if p.parent:
-                        p.parent.mkdir(parents=True, exist_ok=True)
-                result = nodeop.run_op(resolved_op)
-                nodestate.get_state(node).set_result(result)
-                for dep in node._get_dep_nodes():
-                    dependant_counts[dep] -= 1
-                    if not dependant_counts[dep] and dep not in target_nodes:
-                        nodestate.get_state(dep).release()
-
-            # Generate return value
-            if not return_results:
-                return_value = None
-            elif isinstance(targets, dict):
-                return_value = {
-                    k: n._result() for k, n in targets.items()
-                }
-            elif isinstance(targets, tuple):
-                return_value = tuple(n._result() for n in targets)
-            else:
-                return_value = targets._result()
+        for node in nodes_to_run:
+            if not node._must_run():
+                if not (force and node in target_nodes):
+                    continue
+            node_ctx = NodeContext(node)
+            resolved_op = walkproto.resolve_op(node._op, node_ctx)
+            for pout in node._pathouts:
+                parent = pout.parent
+                if parent not in made_dirs:
+                    pathlib.Path(parent).mkdir(parents=True, exist_ok=True)
+                    made_dirs.add(parent)
+            result = nodeop.run_op(resolved_op)
+            nodestate.get_state(node).set_result(result)
+            # Dependencies must be deduplicated here as well, since that is
+            # how util.topological_sort() counts them.
+            for dep in dict.fromkeys(node._get_dep_nodes()):
+                dependant_counts[dep] -= 1
+                if not dependant_counts[dep] and dep not in target_nodes:
+                    nodestate.get_state(dep).release()
+
+        # Generate return value
+        if not return_results:
+            return_value = None
+        elif isinstance(targets, dict):
+            return_value = {
+                k: n._result() for k, n in targets.items()
+            }
+        elif isinstance(targets, tuple):
+            return_value = tuple(n._result() for n in targets)
+        else:
+            return_value = targets._result()
 
         return return_value
 
@@ -92,11 +92,11 @@ assert set(_nodeop_classes) == set(ty.get_args(NodeOp))
 
 
 class PathIn(pathlib.PurePosixPath):
-    pass
+    __slots__: ty.List[str] = []
 
 
 class PathOut(pathlib.PurePosixPath):
-    pass
+    __slots__: ty.List[str] = []
 
 
 class ResourceIn(ty.Generic[NODE_T]):
@@ -5,8 +5,11 @@ from __future__ import annotations
 
 import datetime
 import hashlib
+import importlib
+import io
 import os
 import pathlib
+import pickle as stdpickle
 import shutil
 import tempfile
 import types
@@ -26,6 +29,182 @@ from . import (
 T = ty.TypeVar('T')
 
 
+_xxhash: ty.Optional[types.ModuleType]
+try:
+    _xxhash = importlib.import_module('xxhash')
+except ImportError:
+    _xxhash = None
+else:
+    # XXH3 is only available starting at xxhash 2.0
+    if not hasattr(_xxhash, 'xxh3_128_hexdigest'):
+        _xxhash = None
+
+
+def _hexdigest(data: bytes) -> str:
+    """
+    Return a hexadecimal digest of ``data`` to be used as a content identifier.
+
+    Digests are not used for security purposes, so a fast non-cryptographic
+    hash is preferred: XXH3 (128 bits) is used if the package ``xxhash`` is
+    available. Otherwise, SHA-256 is used, truncated to the same length.
+    """
+    if _xxhash is not None:
+        return str(_xxhash.xxh3_128_hexdigest(data))
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+def _code_attrs(*attrs: ty.Any) -> None:
+    """
+    Placeholder callable used by ``_DescriptorHashPickler`` when reducing code
+    objects. It is only referenced by name and is never called.
+    """
+
+
+# Attributes that identify a code object. Not all of them are available in
+# every Python version and ``co_lnotab`` is derived from ``co_linetable`` when
+# the latter exists.
+_CODE_ATTRS = tuple(
+    name
+    for name in (
+        'co_argcount',
+        'co_posonlyargcount',
+        'co_kwonlyargcount',
+        'co_nlocals',
+        'co_stacksize',
+        'co_flags',
+        'co_code',
+        'co_consts',
+        'co_names',
+        'co_varnames',
+        'co_filename',
+        'co_name',
+        'co_qualname',
+        'co_firstlineno',
+        'co_linetable',
+        'co_exceptiontable',
+        'co_freevars',
+        'co_cellvars',
+    )
+    if hasattr(_code_attrs.__code__, name)
+)
+if not hasattr(_code_attrs.__code__, 'co_linetable'):
+    _CODE_ATTRS += ('co_lnotab',)
+
+
+class _DescriptorHashPickler(stdpickle.Pickler):
+    """
+    Pickler used to serialize node descriptors for hashing only.
+
+    The pickler from the standard library is implemented in C and is much
+    faster than dill's. Code objects, which it does not support, are reduced
+    to their attributes. Classes and functions defined in ``__main__`` are
+    rejected, since dill would pickle them by value.
+    """
+    def reducer_override(self, obj: ty.Any) -> ty.Any:
+        if type(obj) is types.CodeType:
+            return _code_attrs, tuple(getattr(obj, a) for a in _CODE_ATTRS)
+        if (isinstance(obj, (type, types.FunctionType))
+                and obj.__module__ == '__main__'):
+            raise stdpickle.PicklingError(f'{obj} is defined in __main__')
+        return NotImplemented
+
+
+class _DescriptorDigest(ty.NamedTuple):
+    """
+    Placeholder for a node descriptor nested in another one, used when hashing
+    or saving the latter.
+    """
+    hexdigest: str
+
+
+_DescriptorDigests = ty.Dict[int, ty.Tuple['walkproto.NodeDescriptor', str]]
+
+
+def _descriptor_hexdigest(node_descriptor: walkproto.NodeDescriptor,
+                          digests: ty.Optional[_DescriptorDigests] = None,
+                          ) -> str:
+    """
+    Return a hexadecimal digest of ``node_descriptor``.
+
+    Node descriptors nested in ``node_descriptor`` are hashed on their own
+    and replaced by their digests (like in a Merkle tree, see
+    ``_flat_descriptor()``), so the cost of hashing a descriptor does not grow
+    with the number of its ancestors. ``digests`` maps ids of descriptors to
+    already computed digests and is updated by this function. The descriptors
+    are kept along with the digests so that their ids remain valid.
+
+    The result is serialized with ``_DescriptorHashPickler`` if possible,
+    falling back to dill otherwise.
+    """
+    if digests is None:
+        digests = {}
+
+    # Nested descriptors are hashed before the ones containing them using an
+    # explicit stack instead of recursion, since descriptors of long chains of
+    # nodes are deeply nested.
+    stack = [node_descriptor]
+    while stack:
+        desc = stack[-1]
+        if id(desc) in digests:
+            stack.pop()
+            continue
+        pending = [d for d in _nested_descriptors(desc) if id(d) not in digests]
+        if pending:
+            stack.extend(pending)
+            continue
+        stack.pop()
+        hash_input = _flat_descriptor(desc, digests)
+        buf = io.BytesIO()
+        try:
+            _DescriptorHashPickler(buf, protocol=4).dump(hash_input)
+        except (stdpickle.PicklingError, AttributeError, TypeError):
+            hexdigest = _hexdigest(pickle.dumps(hash_input))
+        else:
+            hexdigest = _hexdigest(buf.getvalue())
+        digests[id(desc)] = (desc, hexdigest)
+
+    return digests[id(node_descriptor)][1]
+
+
+def _nested_descriptors(node_descriptor: walkproto.NodeDescriptor,
+                        ) -> ty.Generator[walkproto.NodeDescriptor, None, None]:
+    """
+    Yield the node descriptors directly nested in ``node_descriptor``.
+    """
+    for item in node_descriptor:
+        if type(item) is tuple:
+            yield item
+        elif isinstance(item, walkproto.ResourceProducersDescriptor):
+            yield from item.descriptors
+
+
+def _flat_descriptor(node_descriptor: walkproto.NodeDescriptor,
+                     digests: _DescriptorDigests,
+                     ) -> ty.Tuple[ty.Any, ...]:
+    """
+    Return ``node_descriptor`` with the node descriptors nested in it replaced
+    by their digests. Unlike node descriptors, the result is not nested once
+    per ancestor node, so it can be pickled and compared regardless of the
+    depth of the graph. This is the form saved to and compared with
+    ``node_descriptor.pickle`` files.
+
+    ``digests`` is the same as for ``_descriptor_hexdigest()``.
+    """
+    def nested_digest(d: walkproto.NodeDescriptor) -> _DescriptorDigest:
+        return _DescriptorDigest(_descriptor_hexdigest(d, digests))
+
+    items: ty.List[ty.Any] = []
+    for item in node_descriptor:
+        if type(item) is tuple:
+            item = nested_digest(item)
+        elif isinstance(item, walkproto.ResourceProducersDescriptor):
+            item = item._replace(
+                descriptors=tuple(nested_digest(d) for d in item.descriptors),
+            )
+        items.append(item)
+    return tuple(items)
+
+
 class State(ty.Generic[T]):
     def __init__(self,
                  node: gn.Node[T],
@@ -33,6 +212,7 @@ class State(ty.Generic[T]):
                  ):
         self.node = node
         self.__workdir = pathlib.Path(workdir) if workdir else None
+        self.__workdir_created = False
         self.__has_result = False
         self.__result: ty.Optional[T] = None
 
@@ -63,7 +243,9 @@ class State(ty.Generic[T]):
         if not self.__workdir:
             return None
 
-        self.__workdir.mkdir(exist_ok=True, parents=True)
+        if not self.__workdir_created:
+            self.__workdir.mkdir(exist_ok=True, parents=True)
+            self.__workdir_created = True
         return self.__workdir
 
 
@@ -76,8 +258,9 @@ class CachedState(ty.Generic[T], State[T]):
                  check_saved_descriptor: bool = True
                  ):
         self.__path = pathlib.Path(path)
+        self.__path_created = False
         self.__cached_is_up_to_date: ty.Optional[bool] = None
-        self.__cached_result_mtime: ty.Optional[datetime.datetime] = None
+        self.__cached_result_mtime: ty.Optional[float] = None
         self.__check_saved_descriptor = check_saved_descriptor
 
         self.__node_descriptor_path = None
@@ -97,26 +280,26 @@ class CachedState(ty.Generic[T], State[T]):
         if not state_dir.is_dir():
             return False
 
-        # Check if any input path has it modification time greater than the
-        # state's timestamp.
-        for p_in in self.node._pathins:
-            pathin_mtime = datetime.datetime.fromtimestamp(
-                pathlib.Path(p_in).stat().st_mtime,
-                tz=datetime.timezone.utc,
+        # Check if any input path has its modification time greater than the
+        # state's timestamp. Only the most recent modification time needs to
+        # be compared.
+        if self.node._pathins:
+            pathins_mtime = max(
+                os.stat(p_in).st_mtime for p_in in self.node._pathins
             )
-            if pathin_mtime > self.get_timestamp():
+            if pathins_mtime > self.__get_result_mtime():
                 return False
 
         # Check if output paths exist and that their modification time is not
         # after the last time this node ran.
-        for p_out in self.node._pathouts:
-            if not pathlib.Path(p_out).exists():
+        if self.node._pathouts:
+            try:
+                pathouts_mtime = max(
+                    os.stat(p_out).st_mtime for p_out in self.node._pathouts
+                )
+            except (FileNotFoundError, NotADirectoryError):
                 return False
-            pathout_mtime = datetime.datetime.fromtimestamp(
-                pathlib.Path(p_out).stat().st_mtime,
-                tz=datetime.timezone.utc,
-            )
-            if pathout_mtime > self.get_timestamp():
+            if pathouts_mtime > self.__get_result_mtime():
                 return False
 
         # If a resource node, check if the resource still exists
@@ -133,20 +316,25 @@ class CachedState(ty.Generic[T], State[T]):
             dep_state = get_state(dep)
             if not dep_state.is_up_to_date():
                 return False
-            if dep_state.get_timestamp() > self.get_timestamp():
+            if isinstance(dep_state, CachedState):
+                # Compare raw modification times and avoid creating datetime
+                # objects.
+                if dep_state.__get_result_mtime() > self.__get_result_mtime():
+                    return False
+            elif dep_state.get_timestamp() > self.get_timestamp():
                 return False
 
         # Finally, if this object was constructed with
         # ``check_saved_descriptor=True``, compare this node's node_descriptor
         # with the one saved in the state directory.
         if self.__check_saved_descriptor:
-            node_descriptor = self.node._get_node_descriptor()
+            flat_descriptor = get_node_flat_descriptor(self.node)
             node_descriptor_path = self.__node_descriptor_path
             if not node_descriptor_path:
                 node_descriptor_path = state_dir / 'node_descriptor.pickle'
             with open(node_descriptor_path, 'rb') as f:
                 saved_descriptor = pickle.load(f)
-            if node_descriptor != saved_descriptor:
+            if flat_descriptor != saved_descriptor:
                 return False
 
         return True
@@ -157,15 +345,16 @@ class CachedState(ty.Generic[T], State[T]):
         return self.__cached_is_up_to_date
 
     def get_timestamp(self) -> datetime.datetime:
-        if self.__cached_result_mtime is not None:
-            return self.__cached_result_mtime
-        result_path = self.__path / 'state' / 'result.pickle'
-        result_mtime = datetime.datetime.fromtimestamp(
-            result_path.stat().st_mtime,
+        return datetime.datetime.fromtimestamp(
+            self.__get_result_mtime(),
             tz=datetime.timezone.utc,
         )
-        self.__cached_result_mtime = result_mtime
-        return result_mtime
+
+    def __get_result_mtime(self) -> float:
+        if self.__cached_result_mtime is None:
+            result_path = self.__path / 'state' / 'result.pickle'
+            self.__cached_result_mtime = result_path.stat().st_mtime
+        return self.__cached_result_mtime
 
     def has_result(self) -> bool:
         if super().has_result():
@@ -186,14 +375,15 @@ class CachedState(ty.Generic[T], State[T]):
         return super().get_result()
 
     def set_result(self, result: T) -> None:
-        self.__path.mkdir(exist_ok=True, parents=True)
+        if not self.__path_created:
+            self.__path.mkdir(exist_ok=True, parents=True)
+            self.__path_created = True
 
         tmpdir = pathlib.Path(tempfile.mkdtemp(dir=self.__path))
         try:
             if not self.__node_descriptor_path:
                 with open(tmpdir / 'node_descriptor.pickle', 'wb') as f:
-                    node_descriptor = self.node._get_node_descriptor()
-                    pickle.dump(node_descriptor, f)
+                    pickle.dump(get_node_flat_descriptor(self.node), f)
 
             with open(tmpdir / 'result.pickle', 'wb') as f:
                 pickle.dump(result, f)
@@ -218,6 +408,7 @@ class StateNamespace:
         self.__states: ty.Dict[gn.Node[T], State[T]] = {}
         self.__node_descriptor_cache: ty.Dict[gn.Node[ty.Any],
                                               walkproto.NodeDescriptor] = {}
+        self.__descriptor_digests: _DescriptorDigests = {}
         self.factory = factory
 
     def get_state(self, node: gn.Node[T]) -> State[T]:
@@ -241,18 +432,38 @@ class StateNamespace:
                  ) -> ty.Optional[bool]:
         global _current_namespace
         _current_namespace = None
-        self.__cleanup()
+        self.reset()
         return None
 
-    def __cleanup(self) -> None:
+    def reset(self) -> None:
+        """
+        Release all states and discard data memoized for nodes (states, node
+        descriptors and their digests), so that changes made to nodes since
+        they were last used in this namespace are taken into account.
+        """
         for s in self.__states.values():
             s.release()
         self.__states = {}
         self.__node_descriptor_cache = {}
+        self.__descriptor_digests = {}
 
     def get_node_descriptor(self, node: gn.Node[ty.Any]) -> walkproto.NodeDescriptor:
         return walkproto.node_descriptor(node, self.__node_descriptor_cache)
 
+    def get_node_hexdigest(self, node: gn.Node[ty.Any]) -> str:
+        return _descriptor_hexdigest(
+            self.get_node_descriptor(node),
+            self.__descriptor_digests,
+        )
+
+    def get_node_flat_descriptor(self,
+                                 node: gn.Node[ty.Any],
+                                 ) -> ty.Tuple[ty.Any, ...]:
+        return _flat_descriptor(
+            self.get_node_descriptor(node),
+            self.__descriptor_digests,
+        )
+
 
 DEFAULT_DB_DIR = pathlib.Path('.yape', 'cache')
 
@@ -265,6 +476,14 @@ class CachedStateDB:
         self.__path = pathlib.Path(path)
         self.__hash_paranoid = hash_paranoid
 
+        self.__entry_dirs: ty.Dict[str, pathlib.Path] = {}
+        """
+        A dictionary mapping node hashes to entry directories found or created
+        by this object. This avoids scanning buckets again when this object is
+        used across multiple runs. It is not used when ``hash_paranoid`` is
+        true, since saved descriptors must be compared in that case.
+        """
+
     def __call__(self, node: gn.Node[T]) -> State[T]:
         entry_dir = self.__find_entry_dir(node)
         return CachedState(
@@ -278,45 +497,95 @@ class CachedStateDB:
         )
 
     def __find_entry_dir(self, node: gn.Node[ty.Any]) -> pathlib.Path:
-        if _current_namespace:
-            node_descriptor = _current_namespace.get_node_descriptor(node)
-        else:
-            node_descriptor = node._get_node_descriptor()
-        descriptor_bytes = pickle.dumps(node_descriptor)
-        node_hash = hashlib.sha256(descriptor_bytes).hexdigest()
+        node_hash = get_node_hexdigest(node)
+        # The flat form is saved and compared instead of the node descriptor
+        # itself, since the latter is nested once per ancestor node and
+        # pickling it would hit the recursion limit for long chains of nodes.
+        flat_descriptor = get_node_flat_descriptor(node)
+
+        if not self.__hash_paranoid:
+            entry_dir = self.__entry_dirs.get(node_hash)
+            if entry_dir is not None and entry_dir.is_dir():
+                return entry_dir
 
         bucket_dir = self.__path / 'entries' / node_hash
-        entry_dirs = bucket_dir.glob('*')
-        if self.__hash_paranoid:
-            for entry_dir in entry_dirs:
-                    with open(entry_dir / 'node_descriptor.pickle', 'rb') as f:
-                        entry_node_descriptor = pickle.load(f)
-                    if entry_node_descriptor == node_descriptor:
-                        return entry_dir
+        found = self.__scan_bucket(node, flat_descriptor, bucket_dir)
+        if found is not None:
+            entry_dir = found
         else:
-            try:
-                entry_dir = next(entry_dirs)
-            except StopIteration:
-                pass
-            else:
-                try:
-                    next(entry_dirs)
-                except StopIteration:
+            # Create a new entry
+            entry_id = str(uuid.uuid4())
+            while (bucket_dir / entry_id).exists():
+                entry_id = str(uuid.uuid4())
+            entry_dir = bucket_dir / entry_id
+            entry_dir.mkdir(exist_ok=True, parents=True)
+            with open(entry_dir / 'node_descriptor.pickle', 'wb') as f:
+                pickle.dump(flat_descriptor, f)
+
+        if not self.__hash_paranoid:
+            self.__entry_dirs[node_hash] = entry_dir
+        return entry_dir
+
+    def __scan_bucket(self,
+                      node: gn.Node[ty.Any],
+                      flat_descriptor: ty.Tuple[ty.Any, ...],
+                      bucket_dir: pathlib.Path,
+                      ) -> ty.Optional[pathlib.Path]:
+        try:
+            with os.scandir(bucket_dir) as it:
+                # Skip hidden entries, like pathlib's glob('*') does, and stray
+                # files (e.g. .DS_Store or .nfs* files).
+                entry_names = [
+                    entry.name for entry in it
+                    if not entry.name.startswith('.') and entry.is_dir()
+                ]
+        except FileNotFoundError:
+            return None
+
+        if self.__hash_paranoid:
+            for entry_name in entry_names:
+                entry_dir = bucket_dir / entry_name
+                with open(entry_dir / 'node_descriptor.pickle', 'rb') as f:
+                    entry_node_descriptor = pickle.load(f)
+                if entry_node_descriptor == flat_descriptor:
                     return entry_dir
-                else:
-                    msg = f'more than one entry dir found for {node} in {bucket_dir}'
-                    raise RuntimeError(msg)
+        elif len(entry_names) == 1:
+            return bucket_dir / entry_names[0]
+        elif entry_names:
+            msg = f'more than one entry dir found for {node} in {bucket_dir}'
+            raise RuntimeError(msg)
+        return None
 
-        # Create a new entry
-        entry_id = str(uuid.uuid4())
-        while (bucket_dir / entry_id).exists():
-            entry_id = str(uuid.uuid4())
-        entry_dir = bucket_dir / entry_id
-        entry_dir.mkdir(exist_ok=True, parents=True)
-        with open(entry_dir / 'node_descriptor.pickle', 'wb') as f:
-            pickle.dump(node_descriptor, f)
 
-        return entry_dir
+def get_node_descriptor(node: gn.Node[ty.Any]) -> walkproto.NodeDescriptor:
+    """
+    Return the node descriptor of ``node``. If there is a state namespace in
+    place, its cache of node descriptors is used.
+    """
+    if _current_namespace:
+        return _current_namespace.get_node_descriptor(node)
+    return node._get_node_descriptor()
+
+
+def get_node_hexdigest(node: gn.Node[ty.Any]) -> str:
+    """
+    Return a hexadecimal digest of the node descriptor of ``node``. If there
+    is a state namespace in place, its caches are used.
+    """
+    if _current_namespace:
+        return _current_namespace.get_node_hexdigest(node)
+    return _descriptor_hexdigest(node._get_node_descriptor())
+
+
+def get_node_flat_descriptor(node: gn.Node[ty.Any]) -> ty.Tuple[ty.Any, ...]:
+    """
+    Return the node descriptor of ``node`` with nested node descriptors
+    replaced by their digests (see ``_flat_descriptor()``). If there is a
+    state namespace in place, its caches are used.
+    """
+    if _current_namespace:
+        return _current_namespace.get_node_flat_descriptor(node)
+    return _flat_descriptor(node._get_node_descriptor(), {})
 
 
 def get_state(node: gn.Node[T]) -> State[T]:
@@ -325,4 +594,13 @@ def get_state(node: gn.Node[T]) -> State[T]:
     return _current_namespace.get_state(node)
 
 
+def reset_states() -> None:
+    """
+    Call ``reset()`` on the state namespace currently in place.
+    """
+    if not _current_namespace:
+        raise RuntimeError('not in a state namespace context')
+    _current_namespace.reset()
+
+
 _current_namespace: ty.Optional[StateNamespace] = None
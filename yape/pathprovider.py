@@ -23,6 +23,7 @@ class PathProvider(resmod.ResourceProvider[pathlib.Path]):
                  base: ty.Union[pathlib.Path, str] = DEFAULT_PATH_PROVIDER_BASE,
                  ):
         self.__base = pathlib.Path(base)
+        self.__entries_dir_created = False
 
     def match(self, request: resmod.ResourceRequest[ty.Any]) -> bool:
         return isinstance(request, PathRequest)
@@ -55,6 +56,7 @@ class PathProvider(resmod.ResourceProvider[pathlib.Path]):
 
     def __entries_dir(self, create: bool = False) -> pathlib.Path:
         d = self.__base / 'entries'
-        if create:
+        if create and not self.__entries_dir_created:
             d.mkdir(exist_ok=True, parents=True)
+            self.__entries_dir_created = True
         return d
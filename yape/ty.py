@@ -24,6 +24,7 @@ from typing import (
     Protocol as Protocol,
     Sequence as Sequence,
     Set as Set,
+    TYPE_CHECKING as TYPE_CHECKING,
     Tuple as Tuple,
     TypeVar as TypeVar,
     Type as Type,
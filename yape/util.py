@@ -3,7 +3,6 @@
 # file, You can obtain one at https://mozilla.org/MPL/2.0/.
 from __future__ import annotations
 
-import collections
 import logging
 
 from . import (
@@ -18,60 +17,78 @@ T = ty.TypeVar('T')
 logger = logging.getLogger()
 
 
-def topological_sort(target_nodes: ty.Iterable[gn.Node[ty.Any]],
-                     ) -> ty.Tuple[ty.List[gn.Node[ty.Any]],
-                                   collections.Counter[gn.Node[ty.Any]]]:
-    visited: ty.Set[gn.Node[ty.Any]] = set()
-    visiting: ty.Set[gn.Node[ty.Any]] = set()
-    sorted_nodes: ty.List[gn.Node[ty.Any]] = []
-    path: ty.List[gn.Node[ty.Any]] = []
-
-    dependant_counts: collections.Counter[gn.Node[ty.Any]]
-    dependant_counts = collections.Counter()
+class CircularDependencyError(Exception):
+    """
+    Raised when the dependencies of a set of nodes form a cycle.
+    """
+    def __init__(self, path: ty.Sequence[gn.Node[ty.Any]]):
+        self.path = tuple(path)
+        """
+        The nodes forming the cycle. Each node depends on the one following
+        it, and the first and last nodes are the same.
+        """
+        path_str = ' <- '.join(str(n) for n in reversed(self.path))
+        super().__init__(f'circular dependency found between nodes: {path_str}')
 
-    stack: ty.List[ty.Tuple[gn.Node[ty.Any], ty.Optional[ty.List[gn.Node[ty.Any]]]]]
-    stack = [(node, None) for node in target_nodes]
 
+def topological_sort(target_nodes: ty.Iterable[gn.Node[ty.Any]],
+                     ) -> ty.Tuple[ty.List[gn.Node[ty.Any]],
+                                   ty.Dict[gn.Node[ty.Any], int]]:
+    # Collect the nodes reachable from the targets along with their
+    # (deduplicated) dependencies. Dictionaries are used instead of sets so
+    # that the resulting order does not depend on object ids.
+    deps_map: ty.Dict[gn.Node[ty.Any], ty.List[gn.Node[ty.Any]]] = {}
+    dependants: ty.Dict[gn.Node[ty.Any], ty.List[gn.Node[ty.Any]]] = {}
+
+    dependant_counts: ty.Dict[gn.Node[ty.Any], int] = {}
+
+    # Items are pushed in reverse so that they are popped (and thus
+    # discovered) in the order they were given.
+    stack = list(target_nodes)
+    stack.reverse()
     while stack:
-        node, state = stack.pop()
-
-        if state is None:
-            if node in visited:
-                # This node and dependencies have already been added to the
-                # execution list
-                continue
-
+        node = stack.pop()
+        if node in deps_map:
+            continue
+        deps = list(dict.fromkeys(node._get_dep_nodes()))
+        deps_map[node] = deps
+        for dep in deps:
+            dependant_counts[dep] = dependant_counts.get(dep, 0) + 1
+            dependants.setdefault(dep, []).append(node)
+        stack.extend(dep for dep in reversed(deps) if dep not in deps_map)
+
+    # Kahn's algorithm: a node is ready as soon as all of its dependencies
+    # have been added to the execution list. Ready nodes are kept in a stack
+    # (pushed in reverse, so that they are popped in order) so that a chain of
+    # nodes is finished before another one is started. This allows results of
+    # intermediate nodes to be released as early as possible when running.
+    pending = {node: len(deps) for node, deps in deps_map.items()}
+    ready = [n for n, count in pending.items() if not count]
+    ready.reverse()
+    sorted_nodes: ty.List[gn.Node[ty.Any]] = []
+    while ready:
+        node = ready.pop()
+        sorted_nodes.append(node)
+        newly_ready = []
+        for dependant in dependants.get(node, ()):
+            pending[dependant] -= 1
+            if not pending[dependant]:
+                newly_ready.append(dependant)
+        newly_ready.reverse()
+        ready.extend(newly_ready)
+
+    if len(sorted_nodes) < len(deps_map):
+        # Every node left behind has at least one dependency that was also
+        # left behind, so following those dependencies necessarily leads to
+        # a cycle.
+        node = next(n for n, count in pending.items() if count)
+        path: ty.List[gn.Node[ty.Any]] = []
+        seen: ty.Set[gn.Node[ty.Any]] = set()
+        while node not in seen:
+            seen.add(node)
             path.append(node)
-
-            if node in visiting:
-                # If I am still visiting this node, this means a circular
-                # dependency has been found
-                path_str = ' <- '.join(str(n) for n in reversed(path))
-                raise Exception(f'circular dependency found between nodes: {path_str}')
-
-            # Get dependencies, push back to stack and mark node as
-            # visiting
-            deps = list(set(node._get_dep_nodes()))
-
-            for dep in deps:
-                dependant_counts[dep] += 1
-
-            stack.append((node, deps))
-            visiting.add(node)
-        else:
-            deps = state
-            # If there are no more dependencies to be added to the
-            # execution list, the node is ready to be added. If not, then
-            # push the next node to the stack.
-            if not deps:
-                sorted_nodes.append(node)
-                visited.add(node)
-                visiting.remove(node)
-                path.pop()
-            else:
-                dep = deps.pop()
-                stack.append((node, deps))
-                stack.append((dep, None))
+            node = next(dep for dep in deps_map[node] if pending[dep])
+        raise CircularDependencyError(path[path.index(node):] + [node])
 
     return sorted_nodes, dependant_counts
 
@@ -117,15 +134,25 @@ def parse_targets(targets: ty.Optional[TargetsSpec],
 
             return node
 
-    if isinstance(targets, ty.Mapping):
+    if isinstance(targets, gn.Node):
+        # Fast path for the common case of a single node.
+        return {targets}, targets
+
+    # Checks against the abstract types from the typing module are slow
+    # compared to checking for concrete types, so do the latter first.
+    if isinstance(targets, dict) or (
+            not isinstance(targets, (tuple, list))
+            and isinstance(targets, ty.Mapping)):
         targets = {
             k: get_node(v, graph) for k, v in targets.items()
         }
         nodes = set(targets.values())
-    elif isinstance(targets, ty.Sequence) and not isinstance(targets, str):
+    elif isinstance(targets, (tuple, list)) or (
+            isinstance(targets, ty.Sequence)
+            and not isinstance(targets, str)):
         targets = tuple(get_node(t, graph) for t in targets)
         nodes = set(targets)
-    elif callable(targets) and not isinstance(targets, gn.Node):
+    elif callable(targets):
         if not graph:
             raise ValueError('graph is required when targets is a callable')
         targets = tuple(n for n in graph.recurse_nodes() if targets(n))
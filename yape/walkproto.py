@@ -240,6 +240,20 @@ def walk(op: nodeop.NodeOp) -> ty.Generator[Event, None, None]:
             yield from walk_value(v, refs)
 
 
+# Types whose values are always described by an ``Other`` event. Checking for
+# them first avoids going through the chain of ``isinstance()`` checks in
+# ``walk_value()`` for the most common kinds of values.
+_OTHER_TYPES = frozenset({
+    bool,
+    bytes,
+    complex,
+    float,
+    int,
+    str,
+    type(None),
+})
+
+
 def walk_value(value: ty.Any,
                refs: ty.Dict[int, int],
                ) -> ty.Generator[Event, None, None]:
@@ -250,7 +264,9 @@ def walk_value(value: ty.Any,
     refs[id(value)] = len(refs)
     yield _event(ValueId, refs[id(value)])
 
-    if isinstance(value, nodeop.PathOut):
+    if type(value) in _OTHER_TYPES:
+        yield _event(Other, value)
+    elif isinstance(value, nodeop.PathOut):
         yield _event(PathOut, value)
     elif isinstance(value, nodeop.PathIn):
         yield _event(PathIn, value)
@@ -312,11 +328,51 @@ def node_descriptor(node: gn.Node[ty.Any],
                     *,
                     _resource_node: ty.Optional[gn.Node[ty.Any]] = None,
                     ) -> NodeDescriptor:
-    if (cache is not None
-            and not isinstance(node._op, nodeop.Value)
-            and node in cache):
+    if cache is None:
+        # Use a local cache so that descriptors of nodes shared by multiple
+        # dependants are computed only once.
+        cache = {}
+
+    if _resource_node is not None or isinstance(node._op, nodeop.Value):
+        # Descriptors computed with _resource_node set contain a
+        # ProducedResourceDescriptor marker in place of the resource, so they
+        # must not be shared with regular calls.
+        return _node_descriptor(node, _op_events(node), cache, _resource_node)
+
+    if node in cache:
         return cache[node]
 
+    # Instead of recursing into node dependencies, we use an explicit stack
+    # so that descriptors of dependencies are computed before the ones of
+    # their dependants. That avoids hitting the recursion limit for deep
+    # graphs. Note that the resulting descriptor is still nested once per
+    # ancestor node, so code serializing or comparing descriptors of deep
+    # graphs must not do it recursively (see nodestate._flat_descriptor()).
+    op_events: ty.Dict[gn.Node[ty.Any], ty.List[Event]] = {}
+    stack = [node]
+    while stack:
+        n = stack[-1]
+        if n not in op_events:
+            events = _op_events(n)
+            op_events[n] = events
+            pending = []
+            for evt in events:
+                if (isinstance(evt, Node)
+                        and evt.value not in cache
+                        and evt.value not in op_events):
+                    assert evt.value is not None
+                    if not isinstance(evt.value._op, nodeop.Value):
+                        pending.append(evt.value)
+            if pending:
+                stack.extend(pending)
+                continue
+        stack.pop()
+        if n not in cache:
+            cache[n] = _node_descriptor(n, op_events[n], cache, None)
+    return cache[node]
+
+
+def _op_events(node: gn.Node[ty.Any]) -> ty.List[Event]:
     op = node._op
 
     if isinstance(op, nodeop.Data):
@@ -326,6 +382,14 @@ def node_descriptor(node: gn.Node[ty.Any],
         if op.id:
             op = op._replace(payload=None)
 
+    return list(walk(op))
+
+
+def _node_descriptor(node: gn.Node[ty.Any],
+                     events: ty.List[Event],
+                     cache: ty.Dict[gn.Node[ty.Any], NodeDescriptor],
+                     _resource_node: ty.Optional[gn.Node[ty.Any]],
+                     ) -> NodeDescriptor:
     desc: ty.List[ty.Union[Event, NodeDescriptor]] = []
 
     desc.append(_event(PathinsDescriptor, node._pathins))
@@ -341,7 +405,7 @@ def node_descriptor(node: gn.Node[ty.Any],
             ),
         ),
     )
-    for evt in walk(op):
+    for evt in events:
         if isinstance(evt, Node):
             assert isinstance(evt.value, gn.Node)
             n = evt.value
@@ -367,10 +431,7 @@ def node_descriptor(node: gn.Node[ty.Any],
             desc.append(_event(ModuleDescriptor, evt.value.__name__))
         else:
             desc.append(evt)
-    desc_tuple: NodeDescriptor = tuple(desc)
-    if cache is not None and not isinstance(node._op, nodeop.Value):
-        cache[node] = desc_tuple
-    return desc_tuple
+    return tuple(desc)
 
 
 def resolve_op(op: nodeop.NodeOp,
@@ -120,6 +120,7 @@ class YapeContext:
                 exit_stack.enter_context(p)
             self.__exit_stack = exit_stack.pop_all()
 
+        _current_context = self
         return self
 
     def __exit__(self,
@@ -127,9 +128,13 @@ class YapeContext:
                  exc_value: ty.Optional[BaseException],
                  traceback: ty.Optional[types.TracebackType],
                  ) -> ty.Optional[bool]:
+        global _current_context
         assert self.__exit_stack is not None
-        self.__exit_stack.close()
-        self.__exit_stack = None
+        try:
+            self.__exit_stack.close()
+        finally:
+            self.__exit_stack = None
+            _current_context = None
         return None
 
 